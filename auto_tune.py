@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from segmentation import segment_stone, odd_kernel, MIN_CONTOUR_AREA
+
+
+# (minimum, maximum, smallest step) of each parameter, matching the sliders.
+PARAMETER_RANGES = {
+    "blur_kernel": (1, 65, 2),
+    "threshold_value": (0, 255, 1),
+    "erosion_iterations": (0, 45, 1),
+    "dilation_iterations": (0, 45, 1),
+}
+
+# Step sizes used for the first refinement round; halved every round.
+COARSE_STEPS = {
+    "blur_kernel": 16,
+    "threshold_value": 32,
+    "erosion_iterations": 8,
+    "dilation_iterations": 8,
+}
+
+# Threshold offset used to test how stable the contours are.
+STABILITY_DELTA = 8
+
+# Acceptable fraction of the image covered by stones.
+MIN_COVERAGE = 0.01
+MAX_COVERAGE = 0.8
+
+
+def _clamp(name, value, ranges=PARAMETER_RANGES):
+    """Clamp a parameter into its range and snap it to a valid value."""
+    low, high, _ = ranges[name]
+    value = int(round(min(max(value, low), high)))
+    if name == "blur_kernel":
+        value = min(odd_kernel(value), high)
+    return value
+
+
+def _search_ranges(scale):
+    """
+    Parameter ranges in the units of an image downscaled by scale.
+
+    Blur and morphology act in pixels, so their slider ranges shrink with the
+    image; one step here corresponds to 1/scale steps at full resolution.
+    """
+    ranges = {}
+    for name, (low, high, step) in PARAMETER_RANGES.items():
+        if name != "threshold_value":
+            high = max(low + step, int(round(high * scale)))
+            if name == "blur_kernel":
+                high = odd_kernel(high)
+        ranges[name] = (low, high, step)
+    return ranges
+
+
+def _scale_params(params, factor, ranges):
+    """Convert pixel-based parameters by factor and snap them into ranges."""
+    return {name: _clamp(name, params[name] if name == "threshold_value" else params[name] * factor, ranges)
+            for name in PARAMETER_RANGES}
+
+
+def _candidate_key(params):
+    return tuple(params[name] for name in PARAMETER_RANGES)
+
+
+def _contour_mask(shape, contours):
+    mask = np.zeros(shape, np.uint8)
+    if contours:
+        cv2.drawContours(mask, contours, -1, 255, -1)
+    return mask > 0
+
+
+def _iou(a, b):
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 0.0
+
+
+def edge_strength(image):
+    """
+    Gradient magnitude of a lightly smoothed grayscale image, scaled to [0, 1].
+
+    Used to check that segmented boundaries sit on real edges.
+    """
+    gray = cv2.GaussianBlur(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+    gradient = cv2.magnitude(cv2.Sobel(gray, cv2.CV_32F, 1, 0), cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+    peak = gradient.max()
+    return gradient / peak if peak > 0 else gradient
+
+
+def score_parameters(image, params, min_area=MIN_CONTOUR_AREA, edges=None):
+    """
+    Score one set of segmentation parameters on an image.
+
+    The score combines edge alignment (mean gradient strength along the
+    segmented boundary, which drops as soon as blur or morphology moves the
+    boundary off the stone's edge), contour stability (overlap of the masks
+    found at nearby thresholds), smoothness (area-weighted solidity) and area
+    plausibility (fraction of the image covered by stones). It is 0 when
+    nothing is segmented and at most 1.
+
+    Args:
+        image: BGR image, possibly downscaled from the original
+        params: Parameter dictionary (segmentation_defaults.json keys) in the
+            pixel units of image
+        min_area: Minimum contour area in the pixel units of image
+        edges: Optional precomputed edge_strength(image)
+
+    Returns:
+        Score as a float
+    """
+    kwargs = {
+        "blur_kernel": odd_kernel(params["blur_kernel"]),
+        "erosion_iter": int(params["erosion_iterations"]),
+        "dilation_iter": int(params["dilation_iterations"]),
+        "min_area": min_area,
+    }
+    threshold = params["threshold_value"]
+
+    contours = segment_stone(image, threshold_val=threshold, **kwargs)
+    if not contours:
+        return 0.0
+
+    image_area = image.shape[0] * image.shape[1]
+    area = sum(cv2.contourArea(c) for c in contours)
+    hull_area = sum(cv2.contourArea(cv2.convexHull(c)) for c in contours)
+
+    coverage = area / image_area
+    if coverage < MIN_COVERAGE:
+        plausibility = coverage / MIN_COVERAGE
+    elif coverage > MAX_COVERAGE:
+        plausibility = max(0.0, (1 - coverage) / (1 - MAX_COVERAGE))
+    else:
+        plausibility = 1.0
+
+    smoothness = area / hull_area if hull_area > 0 else 0.0
+
+    if edges is None:
+        edges = edge_strength(image)
+    boundary = np.zeros(image.shape[:2], np.uint8)
+    cv2.drawContours(boundary, contours, -1, 255, 1)
+    edge_alignment = float(edges[boundary > 0].mean())
+
+    mask = _contour_mask(image.shape[:2], contours)
+    overlaps = []
+    for offset in (-STABILITY_DELTA, STABILITY_DELTA):
+        nearby = segment_stone(image, threshold_val=min(max(threshold + offset, 0), 255), **kwargs)
+        overlaps.append(_iou(mask, _contour_mask(image.shape[:2], nearby)))
+    stability = sum(overlaps) / len(overlaps)
+
+    return plausibility * (0.5 * edge_alignment + 0.3 * stability + 0.2 * smoothness)
+
+
+# --- Worker process state, set once by the pool initializer ---
+_worker_image = None
+_worker_edges = None
+_worker_min_area = MIN_CONTOUR_AREA
+
+
+def _init_worker(image, edges, min_area):
+    """Store the downscaled image in the worker so it is sent only once."""
+    global _worker_image, _worker_edges, _worker_min_area
+    _worker_image = image
+    _worker_edges = edges
+    _worker_min_area = min_area
+
+
+def _evaluate(params):
+    return score_parameters(_worker_image, params, _worker_min_area, _worker_edges)
+
+
+def _neighbours(center, steps, ranges, rng, count):
+    """
+    Generate candidates around a center: one step up and down per parameter,
+    plus random perturbations within the current step size.
+    """
+    candidates = []
+    for name, step in steps.items():
+        for direction in (-1, 1):
+            candidate = dict(center)
+            candidate[name] = _clamp(name, center[name] + direction * step, ranges)
+            candidates.append(candidate)
+    for _ in range(count):
+        candidates.append({name: _clamp(name, center[name] + rng.uniform(-step, step), ranges)
+                           for name, step in steps.items()})
+    return candidates
+
+
+def _random_candidate(rng, ranges):
+    return {name: _clamp(name, rng.uniform(low, high), ranges) for name, (low, high, _) in ranges.items()}
+
+
+def auto_tune(image, time_budget=10.0, initial_params=None, workers=None, max_side=512,
+              min_area=MIN_CONTOUR_AREA, coarse_samples=64, top_k=4, seed=0):
+    """
+    Search for the best segmentation parameters for an image.
+
+    The image is downscaled so its longest side is at most max_side, and the
+    search runs in the pixel units of that copy. A coarse random sample of
+    the parameter space (plus the initial parameters) is scored first, then
+    the search repeatedly refines around the best candidates with halving
+    step sizes until the steps reach one downscaled pixel or the time budget
+    runs out. Candidates are scored in parallel across processes, and the
+    best one is converted back to full-resolution slider values.
+
+    Args:
+        image: BGR image as a NumPy array
+        time_budget: Maximum search time in seconds
+        initial_params: Optional starting parameters, e.g. the saved defaults
+        workers: Number of worker processes (defaults to the CPU count; 1 runs inline)
+        max_side: Longest side of the downscaled search image
+        min_area: Full-resolution minimum contour area
+        coarse_samples: Number of random candidates in the coarse stage
+        top_k: Number of best candidates refined each round
+        seed: Random seed, for reproducible searches
+
+    Returns:
+        Tuple of (best parameter dictionary, best score)
+    """
+    deadline = time.perf_counter() + time_budget
+    rng = random.Random(seed)
+
+    scale = min(1.0, max_side / max(image.shape[:2]))
+    if scale < 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    ranges = _search_ranges(scale)
+    min_area = min_area * scale * scale
+    edges = edge_strength(image)
+
+    scores = {}
+    candidates = [_random_candidate(rng, ranges) for _ in range(coarse_samples)]
+    if initial_params:
+        candidates.insert(0, _scale_params(initial_params, scale, ranges))
+
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(image, edges, min_area))
+
+    def run(batch):
+        """Score new candidates until they are done or the budget is spent."""
+        batch = {_candidate_key(c): c for c in batch if _candidate_key(c) not in scores}
+        if pool is None:
+            for key, candidate in batch.items():
+                if time.perf_counter() >= deadline:
+                    return
+                scores[key] = score_parameters(image, candidate, min_area, edges)
+            return
+        pending = {pool.submit(_evaluate, candidate): key for key, candidate in batch.items()}
+        while pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                scores[pending.pop(future)] = future.result()
+        for future in pending:
+            future.cancel()
+
+    def rank(key):
+        """Order by score, breaking ties towards the least blur and morphology."""
+        params = dict(zip(PARAMETER_RANGES, key))
+        processing = params["blur_kernel"] + params["erosion_iterations"] + params["dilation_iterations"]
+        return round(scores[key], 6), -processing
+
+    try:
+        run(candidates)
+        steps = {name: max(ranges[name][2], int(round(step * (1 if name == "threshold_value" else scale))))
+                 for name, step in COARSE_STEPS.items()}
+        while time.perf_counter() < deadline and scores:
+            best = sorted(scores, key=rank, reverse=True)[:top_k]
+            centers = [dict(zip(PARAMETER_RANGES, key)) for key in best]
+            batch = [c for center in centers for c in _neighbours(center, steps, ranges, rng, 4)]
+            before = len(scores)
+            run(batch)
+
+            at_resolution = all(steps[name] <= ranges[name][2] for name in steps)
+            if at_resolution and len(scores) == before:
+                break
+            steps = {name: max(ranges[name][2], step // 2) for name, step in steps.items()}
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    if not scores:
+        return None, 0.0
+    best_key = max(scores, key=rank)
+    best = _scale_params(dict(zip(PARAMETER_RANGES, best_key)), 1 / scale, PARAMETER_RANGES)
+    return best, scores[best_key]
+
+
+def main():
+    """
+    Tune segmentation parameters for an image from the command line.
+    """
+    parser = argparse.ArgumentParser(description="Automatically tune stone segmentation parameters")
+    parser.add_argument("image")
+    parser.add_argument("--budget", type=float, default=10.0, help="time budget in seconds")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-side", type=int, default=512)
+    parser.add_argument("--save", metavar="PATH", help="write the result as a defaults JSON file")
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        parser.error(f"Could not load image from path: {args.image}")
+
+    params, score = auto_tune(image, time_budget=args.budget, workers=args.workers, max_side=args.max_side)
+    if params is None:
+        parser.exit(1, "No parameters could be evaluated within the time budget.\n")
+    print(json.dumps({"params": params, "score": round(score, 4)}, indent=4))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(params, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import csv
+import os
+
+import cv2
+import numpy as np
+
+
+# Column order of the measurement table.
+MEASUREMENT_COLUMNS = [
+    "contour_index",
+    "area", "pixel_area", "perimeter", "equivalent_diameter",
+    "centroid_x", "centroid_y",
+    "bbox_x", "bbox_y", "bbox_w", "bbox_h",
+    "min_rect_cx", "min_rect_cy", "min_rect_w", "min_rect_h", "min_rect_angle",
+    "hull_area", "solidity", "convexity",
+    "hu_1", "hu_2", "hu_3", "hu_4", "hu_5", "hu_6", "hu_7",
+    "mean_b", "mean_g", "mean_r",
+]
+
+
+def _pack_contours(contours):
+    """
+    Concatenate contours into one point array.
+
+    Returns:
+        Tuple of (points as float64 (P, 2), start offset of each contour,
+        index of the next point along each contour, wrapping to its start)
+    """
+    lengths = np.array([len(c) for c in contours], dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    points = np.concatenate([c.reshape(-1, 2) for c in contours]).astype(np.float64)
+    following = np.arange(len(points)) + 1
+    following[starts + lengths - 1] = starts
+    return points, starts, following
+
+
+def _polygon_area_and_perimeter(contours):
+    """
+    Shoelace area and closed perimeter of every contour in one vectorized pass.
+
+    Matches cv2.contourArea and cv2.arcLength(closed=True).
+    """
+    points, starts, following = _pack_contours(contours)
+    x, y = points[:, 0], points[:, 1]
+    cross = x * y[following] - x[following] * y
+    edges = np.hypot(x[following] - x, y[following] - y)
+    area = np.abs(np.add.reduceat(cross, starts)) / 2
+    perimeter = np.add.reduceat(edges, starts)
+    return area, perimeter, points, starts
+
+
+def _polygon_moments(points, starts, following):
+    """
+    Centroid and central moments up to third order of every contour polygon.
+
+    Uses Green's theorem on the polygon edges, so the cost depends only on the
+    number of contour points, and matches cv2.moments(contour). Points are
+    shifted to each contour's first vertex first to keep the sums well
+    conditioned for large images.
+
+    Returns:
+        Tuple of (m00, centroid x, centroid y, dict of central moments mu_pq)
+    """
+    origin = np.repeat(points[starts], np.diff(np.append(starts, len(points))), axis=0)
+    local = points - origin
+    x0, y0 = local[:, 0], local[:, 1]
+    x1, y1 = x0[following], y0[following]
+    a = x0 * y1 - x1 * y0
+
+    def total(values):
+        return np.add.reduceat(a * values, starts)
+
+    m00 = np.add.reduceat(a, starts) / 2
+    m10 = total(x0 + x1) / 6
+    m01 = total(y0 + y1) / 6
+    m20 = total(x0 * x0 + x0 * x1 + x1 * x1) / 12
+    m11 = total(2 * x0 * y0 + x0 * y1 + x1 * y0 + 2 * x1 * y1) / 24
+    m02 = total(y0 * y0 + y0 * y1 + y1 * y1) / 12
+    m30 = total(x0 ** 3 + x0 * x0 * x1 + x0 * x1 * x1 + x1 ** 3) / 20
+    m21 = total(x1 * x1 * (3 * y1 + y0) + 2 * x0 * x1 * (y1 + y0) + x0 * x0 * (3 * y0 + y1)) / 60
+    m12 = total(y1 * y1 * (3 * x1 + x0) + 2 * y0 * y1 * (x1 + x0) + y0 * y0 * (3 * x0 + x1)) / 60
+    m03 = total(y0 ** 3 + y0 * y0 * y1 + y0 * y1 * y1 + y1 ** 3) / 20
+
+    # Clockwise contours give negative moments; flip them as OpenCV does.
+    sign = np.where(m00 < 0, -1.0, 1.0)
+    m00, m10, m01 = m00 * sign, m10 * sign, m01 * sign
+    m20, m11, m02 = m20 * sign, m11 * sign, m02 * sign
+    m30, m21, m12, m03 = m30 * sign, m21 * sign, m12 * sign, m03 * sign
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cx = m10 / m00
+        cy = m01 / m00
+    mu20 = m20 - cx * m10
+    mu11 = m11 - cx * m01
+    mu02 = m02 - cy * m01
+    mu = {
+        "20": mu20, "11": mu11, "02": mu02,
+        "30": m30 - cx * (3 * mu20 + cx * m10),
+        "21": m21 - cx * (2 * mu11 + cx * m01) - cy * mu20,
+        "12": m12 - cy * (2 * mu11 + cy * m10) - cx * mu02,
+        "03": m03 - cy * (3 * mu02 + cy * m01),
+    }
+    return m00, cx + points[starts, 0], cy + points[starts, 1], mu
+
+
+def _hu_moments(nu20, nu11, nu02, nu30, nu21, nu12, nu03):
+    """Hu's seven invariants from normalized central moments (arrays)."""
+    t0 = nu30 + nu12
+    t1 = nu21 + nu03
+    q0 = t0 * t0
+    q1 = t1 * t1
+    n4 = 4 * nu11
+    s = nu20 + nu02
+    d = nu20 - nu02
+    return np.stack([
+        s,
+        d * d + n4 * nu11,
+        (nu30 - 3 * nu12) ** 2 + (3 * nu21 - nu03) ** 2,
+        q0 + q1,
+        (nu30 - 3 * nu12) * t0 * (q0 - 3 * q1) + (3 * nu21 - nu03) * t1 * (3 * q0 - q1),
+        d * (q0 - q1) + n4 * t0 * t1,
+        (3 * nu21 - nu03) * t0 * (q0 - 3 * q1) - (nu30 - 3 * nu12) * t1 * (3 * q0 - q1),
+    ], axis=1)
+
+
+def measure_contours(image, contours, indices=None):
+    """
+    Measure the geometry and color of many contours at once.
+
+    Geometry, centroid and Hu moments are computed on the concatenated
+    contour points (moments via Green's theorem), so their cost depends only
+    on the number of contour points. Pixel area and mean color come from a
+    single labeled mask reduced with np.bincount.
+
+    Degenerate contours (fewer than three points, or zero enclosed area) keep
+    their row: area is 0, the centroid is the mean of their points, and
+    solidity, convexity and Hu moments are NaN. Mean color is NaN for any
+    contour that covers no pixel.
+
+    Args:
+        image: BGR image the contours were found in
+        contours: List of OpenCV contours
+        indices: Optional contour indices to record (defaults to 0..n-1)
+
+    Returns:
+        Dictionary mapping each column in MEASUREMENT_COLUMNS to a NumPy array
+    """
+    count = len(contours)
+    if count == 0:
+        return {name: np.empty(0) for name in MEASUREMENT_COLUMNS}
+    contour_index = np.arange(count) if indices is None else np.asarray(indices)
+
+    # --- Polygon metrics, vectorized over all points ---
+    points, starts, following = _pack_contours(contours)
+    m00, cx, cy, mu = _polygon_moments(points, starts, following)
+    area = m00
+    perimeter = np.add.reduceat(np.hypot(*(points[following] - points).T), starts)
+    bbox_min = np.minimum.reduceat(points, starts, axis=0)
+    bbox_max = np.maximum.reduceat(points, starts, axis=0)
+
+    hulls = [cv2.convexHull(c) for c in contours]
+    hull_area, hull_perimeter, _, _ = _polygon_area_and_perimeter(hulls)
+    min_rects = np.array([(rx, ry, w, h, a) for (rx, ry), (w, h), a in map(cv2.minAreaRect, contours)],
+                         dtype=np.float64).reshape(-1, 5)
+
+    degenerate = area <= 0
+    lengths = np.diff(np.append(starts, len(points)))
+    cx = np.where(degenerate, np.add.reduceat(points[:, 0], starts) / lengths, cx)
+    cy = np.where(degenerate, np.add.reduceat(points[:, 1], starts) / lengths, cy)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Normalized central moments: nu_pq = mu_pq / m00^(1 + (p + q) / 2)
+        norm2 = np.where(degenerate, np.nan, m00 ** 2)
+        norm3 = np.where(degenerate, np.nan, m00 ** 2.5)
+        hu = _hu_moments(
+            mu["20"] / norm2, mu["11"] / norm2, mu["02"] / norm2,
+            mu["30"] / norm3, mu["21"] / norm3, mu["12"] / norm3, mu["03"] / norm3,
+        )
+        solidity = np.where(degenerate, np.nan, area / hull_area)
+        convexity = np.where(degenerate, np.nan, hull_perimeter / perimeter)
+
+    # --- Pixel metrics from one labeled mask ---
+    labels = np.zeros(image.shape[:2], dtype=np.int16 if count < np.iinfo(np.int16).max else np.int32)
+    for label, contour in enumerate(contours, start=1):
+        cv2.drawContours(labels, [contour], -1, label, -1)
+    inside = labels > 0
+    lab = labels[inside] - 1
+    del labels
+
+    pixel_area = np.bincount(lab, minlength=count).astype(np.float64)
+    channels = [image[..., c] for c in range(3)] if image.ndim == 3 else [image] * 3
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_color = np.stack([np.bincount(lab, weights=channel[inside], minlength=count) / pixel_area
+                               for channel in channels], axis=1)
+
+    table = {
+        "contour_index": contour_index,
+        "area": area,
+        "pixel_area": pixel_area,
+        "perimeter": perimeter,
+        "equivalent_diameter": np.sqrt(4 * area / np.pi),
+        "centroid_x": cx,
+        "centroid_y": cy,
+        "bbox_x": bbox_min[:, 0].astype(np.int64),
+        "bbox_y": bbox_min[:, 1].astype(np.int64),
+        "bbox_w": (bbox_max[:, 0] - bbox_min[:, 0] + 1).astype(np.int64),
+        "bbox_h": (bbox_max[:, 1] - bbox_min[:, 1] + 1).astype(np.int64),
+        "min_rect_cx": min_rects[:, 0],
+        "min_rect_cy": min_rects[:, 1],
+        "min_rect_w": min_rects[:, 2],
+        "min_rect_h": min_rects[:, 3],
+        "min_rect_angle": min_rects[:, 4],
+        "hull_area": hull_area,
+        "solidity": solidity,
+        "convexity": convexity,
+        "mean_b": mean_color[:, 0],
+        "mean_g": mean_color[:, 1],
+        "mean_r": mean_color[:, 2],
+    }
+    for i in range(7):
+        table[f"hu_{i + 1}"] = hu[:, i]
+    return {name: table[name] for name in MEASUREMENT_COLUMNS}
+
+
+def save_measurements(table, path):
+    """
+    Save a measurement table to disk, choosing the format by file extension.
+
+    ".csv" writes one row per contour; ".npz" writes a columnar NumPy archive
+    that can be loaded back with np.load.
+
+    Args:
+        table: Dictionary of equal-length column arrays
+        path: Destination file path
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npz":
+        np.savez_compressed(path, **table)
+    elif extension == ".csv":
+        columns = list(table)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*(table[name].tolist() for name in columns)))
+    else:
+        raise ValueError(f"Unsupported measurement file type: {extension or path}")
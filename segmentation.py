@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+
+
+# Contours smaller than this (in pixels) are treated as background noise.
+MIN_CONTOUR_AREA = 50000
+
+
+def segment_stone(image, blur_kernel, threshold_val, erosion_iter, dilation_iter, min_area=MIN_CONTOUR_AREA):
+    """
+    Perform segmentation using area, returning filtered contours.
+
+    This is the GUI-independent core of the segmentation page, so it can be
+    shared by the segmentation window and the headless segmentation service.
+
+    Args:
+        image: BGR image as a NumPy array
+        blur_kernel: Gaussian blur kernel size (odd)
+        threshold_val: Binary threshold value (0-255)
+        erosion_iter: Number of erosion iterations
+        dilation_iter: Number of dilation iterations
+        min_area: Minimum contour area to keep
+
+    Returns:
+        List of contours whose area exceeds min_area
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (blur_kernel, blur_kernel), 0)
+    _, thresh = cv2.threshold(blurred, threshold_val, 255, cv2.THRESH_BINARY)
+    kernel = np.ones((3, 3), np.uint8)
+    if erosion_iter > 0: thresh = cv2.erode(thresh, kernel, iterations=erosion_iter)
+    if dilation_iter > 0: thresh = cv2.dilate(thresh, kernel, iterations=dilation_iter)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    # Filter contours by the fixed minimum area
+    return [c for c in contours if cv2.contourArea(c) > min_area]
+
+
+def odd_kernel(value):
+    """
+    Convert a slider value into a valid (odd, positive) blur kernel size.
+
+    Args:
+        value: Raw kernel value, possibly a float or even number
+
+    Returns:
+        Odd integer kernel size
+    """
+    blur_kernel = max(1, int(value))
+    if blur_kernel % 2 == 0: blur_kernel += 1
+    return blur_kernel
@@ -0,0 +1,546 @@
+import argparse
+import json
+import math
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+from segmentation import segment_stone, odd_kernel, MIN_CONTOUR_AREA
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def _warm_worker():
+    """
+    Pool initializer: import OpenCV and run one tiny segmentation.
+
+    This pays the import and first-call cost once per worker process, so the
+    first real request does not.
+    """
+    segment_stone(np.zeros((8, 8, 3), np.uint8), 3, 127, 0, 0, 0)
+
+
+def _ping():
+    """No-op task used to force the pool to start all of its workers."""
+    return os.getpid()
+
+
+def _attach_shared_memory(name):
+    """
+    Attach to a shared memory block created by a client without taking ownership.
+
+    Before Python 3.13 attaching always registers the block with the resource
+    tracker, which would unlink it when this process exits. Workers may share
+    the tracker of the process that created the block, so undoing the
+    registration afterwards would remove the creator's entry too; instead the
+    registration is skipped while attaching.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _segment_job(job):
+    """
+    Segment a single image described by a job dictionary.
+
+    The image comes either from a file path or from a named shared memory
+    block, so pixel data never travels over the socket.
+
+    Args:
+        job: Dictionary with "path" or "shm"/"shape"/"dtype", plus parameters
+
+    Returns:
+        List of contours as nested [x, y] point lists
+    """
+    params = job.get("params", {})
+    kwargs = {
+        "blur_kernel": odd_kernel(params.get("blur_kernel", 5)),
+        "threshold_val": int(params.get("threshold_value", 127)),
+        "erosion_iter": int(params.get("erosion_iterations", 2)),
+        "dilation_iter": int(params.get("dilation_iterations", 2)),
+        "min_area": float(params.get("min_area", MIN_CONTOUR_AREA)),
+    }
+
+    if "shm" in job:
+        shm = _attach_shared_memory(job["shm"])
+        try:
+            image = np.ndarray(tuple(job["shape"]), dtype=np.dtype(job.get("dtype", "uint8")), buffer=shm.buf)
+            contours = segment_stone(image, **kwargs)
+            del image
+        finally:
+            shm.close()
+    else:
+        image = cv2.imread(job["path"])
+        if image is None:
+            raise ValueError(f"Could not load image from path: {job['path']}")
+        contours = segment_stone(image, **kwargs)
+
+    return [c.reshape(-1, 2).tolist() for c in contours]
+
+
+def _segment_batch(jobs):
+    """
+    Segment a batch of jobs inside one worker task.
+
+    Errors are captured per job so one bad image does not fail the batch.
+
+    Returns:
+        List of ("ok", contours) or ("error", message) tuples, in job order
+    """
+    results = []
+    for job in jobs:
+        try:
+            results.append(("ok", _segment_job(job)))
+        except Exception as e:
+            results.append(("error", str(e)))
+    return results
+
+
+class SegmentationService:
+    """
+    A warm segmentation backend shared by several stations and scripts.
+
+    Requests are queued and dispatched to a pre-warmed process pool, at most
+    one task per worker at a time, so waiting requests stay in the queue.
+    When requests pile up beyond the idle workers they are grouped into
+    batches, sized so the queued work is spread over every idle worker.
+    Images are passed by file path or shared memory name, never as pixel
+    payloads. If a worker process dies, the batches it broke fail and the
+    pool is recreated and warmed again before the next batch.
+
+    Args:
+        workers: Number of worker processes (defaults to the CPU count)
+        batch_size: Maximum number of jobs sent to a worker in one task
+        batch_window: Seconds to wait for more jobs before dispatching a batch
+    """
+
+    def __init__(self, workers=None, batch_size=8, batch_window=0.005):
+        """
+        Initialize the service; the worker pool is created by start().
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker_available = threading.Condition(self._lock)
+        self._idle_workers = self.workers
+        self._latencies = deque(maxlen=1000)
+        self._waiting = 0
+        self._running_jobs = 0
+        self._running_batches = 0
+        self._requests_total = 0
+        self._errors_total = 0
+        self._batches_total = 0
+        self._running = False
+        self._pool = None
+        self._pool_broken = False
+        self._pool_restarts = 0
+
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+
+    def start(self):
+        """
+        Pre-warm every worker process and start the batching dispatcher.
+        """
+        self._start_pool()
+        self._running = True
+        self._dispatcher.start()
+
+    def _start_pool(self):
+        """
+        Create a new worker pool and wait until every worker is warm.
+        """
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        self._pool = pool
+        # Each worker runs the initializer before taking its first task.
+        pings = [pool.submit(_ping) for _ in range(self.workers)]
+        for ping in pings:
+            ping.result()
+        self._pool_broken = False
+
+    def _restart_pool(self):
+        """
+        Replace a broken worker pool with a freshly warmed one.
+        """
+        old_pool = self._pool
+        self._pool_broken = True
+        with self._lock:
+            self._pool_restarts += 1
+        old_pool.shutdown(wait=False, cancel_futures=True)
+        self._start_pool()
+
+    def stop(self):
+        """
+        Stop the dispatcher and shut down the worker pool.
+        """
+        if self._running:
+            self._running = False
+            self._queue.put(None)
+            self._dispatcher.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def submit(self, job):
+        """
+        Queue a segmentation job.
+
+        Args:
+            job: Job dictionary (see _segment_job)
+
+        Returns:
+            Future resolved with the list of contours
+        """
+        future = Future()
+        with self._lock:
+            self._requests_total += 1
+            self._waiting += 1
+        self._queue.put((job, future, time.perf_counter()))
+        return future
+
+    def _batch_limit(self, collected):
+        """
+        Number of jobs the batch being collected may hold.
+
+        Queued work is spread over the idle workers (including the one reserved
+        for this batch), so jobs are only grouped when there are more of them
+        than idle workers.
+        """
+        with self._lock:
+            idle = self._idle_workers + 1
+            pending = self._waiting
+        return min(self.batch_size, max(collected, math.ceil(pending / idle)))
+
+    def _dispatch_loop(self):
+        """
+        Wait for an idle worker, collect queued jobs into a batch and hand it over.
+        """
+        while True:
+            with self._worker_available:
+                while self._idle_workers == 0:
+                    self._worker_available.wait()
+                self._idle_workers -= 1
+
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self._batch_limit(len(batch)):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            with self._lock:
+                self._waiting -= len(batch)
+                self._running_jobs += len(batch)
+                self._running_batches += 1
+                self._batches_total += 1
+            task = self._submit_batch([job for job, _, _ in batch])
+            task.add_done_callback(lambda t, batch=batch: self._complete_batch(t, batch))
+
+    def _submit_batch(self, jobs):
+        """
+        Hand a batch to the pool, recreating the pool first if it is broken.
+
+        Returns:
+            Future of the batch; if the pool cannot be restored it is already
+            failed with the error, so the batch's requests are still resolved.
+        """
+        try:
+            if self._pool_broken:
+                self._restart_pool()
+            try:
+                return self._pool.submit(_segment_batch, jobs)
+            except BrokenProcessPool:
+                # The pool broke before this batch reached it, so retry once.
+                self._restart_pool()
+                return self._pool.submit(_segment_batch, jobs)
+        except Exception as e:
+            task = Future()
+            task.set_exception(e)
+            return task
+
+    def _complete_batch(self, task, batch):
+        """
+        Resolve the per-request futures of a finished batch and record metrics.
+        """
+        try:
+            results = task.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._pool_broken = True
+            results = [("error", str(e) or type(e).__name__)] * len(batch)
+
+        now = time.perf_counter()
+        with self._worker_available:
+            self._idle_workers += 1
+            self._running_jobs -= len(batch)
+            self._running_batches -= 1
+            self._worker_available.notify()
+            for (_, _, queued_at), (status, _) in zip(batch, results):
+                self._latencies.append(now - queued_at)
+                if status != "ok":
+                    self._errors_total += 1
+
+        for (_, future, _), (status, value) in zip(batch, results):
+            if status == "ok":
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+    def health(self):
+        """
+        Report whether the dispatcher is running and the worker pool is usable.
+        """
+        dispatcher_alive = self._dispatcher.is_alive()
+        with self._lock:
+            pool_restarts = self._pool_restarts
+        return {
+            "status": "ok" if dispatcher_alive and not self._pool_broken else "unhealthy",
+            "dispatcher_alive": dispatcher_alive,
+            "pool_broken": self._pool_broken,
+            "pool_restarts": pool_restarts,
+        }
+
+    def metrics(self):
+        """
+        Return queue depth, running jobs, throughput counters and latency percentiles.
+
+        A worker segments its batch one job at a time, so running counts one
+        request per busy worker and queue_depth counts every other unfinished
+        request: those still in the service queue (waiting_for_worker) plus
+        those waiting behind another job in a dispatched batch.
+
+        Latencies are measured from enqueue to completion, in milliseconds,
+        over the most recent 1000 requests.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            metrics = {
+                "workers": self.workers,
+                "queue_depth": self._waiting + self._running_jobs - self._running_batches,
+                "waiting_for_worker": self._waiting,
+                "running": self._running_batches,
+                "requests_total": self._requests_total,
+                "errors_total": self._errors_total,
+                "batches_total": self._batches_total,
+                "pool_restarts": self._pool_restarts,
+            }
+
+        def percentile(p):
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))
+            return round(latencies[index] * 1000, 3)
+
+        metrics["latency_ms"] = {
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": percentile(100),
+        }
+        return metrics
+
+
+class SegmentationRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler exposing POST /segment, GET /metrics and GET /health.
+    """
+
+    # Maximum seconds a single request waits for its result.
+    request_timeout = 60
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif self.path == "/health":
+            health = self.server.service.health()
+            self._send_json(200 if health["status"] == "ok" else 503, health)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/segment":
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length) or b"{}")
+            if "path" not in job and "shm" not in job:
+                raise ValueError("Request must contain either 'path' or 'shm'")
+            if "shm" in job and "shape" not in job:
+                raise ValueError("Shared memory requests must contain 'shape'")
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            contours = self.server.service.submit(job).result(timeout=self.request_timeout)
+            self._send_json(200, {"contours": contours})
+        except Exception as e:
+            self._send_json(500, {"error": str(e) or type(e).__name__})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet; use /metrics for observability.
+        pass
+
+
+class SegmentationServer(ThreadingHTTPServer):
+    """
+    Localhost HTTP server that owns a SegmentationService.
+
+    Args:
+        service: Started SegmentationService instance
+        host: Interface to bind (localhost by default)
+        port: Port to bind, 0 picks a free port
+    """
+
+    daemon_threads = True
+
+    def __init__(self, service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        super().__init__((host, port), SegmentationRequestHandler)
+        self.service = service
+
+
+class SegmentationClient:
+    """
+    Client for a running segmentation server.
+
+    Args:
+        host: Server host
+        port: Server port
+        timeout: Socket timeout in seconds
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=60):
+        self.base_url = f"http://{host}:{port}"
+        self.timeout = timeout
+
+    def segment_path(self, path, params=None):
+        """
+        Segment an image file that the server can read directly.
+
+        Returns:
+            List of contours as NumPy arrays in OpenCV layout (N, 1, 2)
+        """
+        return self._segment({"path": os.path.abspath(path), "params": params or {}})
+
+    def segment_array(self, image, params=None):
+        """
+        Segment an in-memory image by handing it to the server through shared memory.
+
+        Returns:
+            List of contours as NumPy arrays in OpenCV layout (N, 1, 2)
+        """
+        image = np.ascontiguousarray(image)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+        try:
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+            return self._segment({
+                "shm": shm.name,
+                "shape": list(image.shape),
+                "dtype": image.dtype.str,
+                "params": params or {},
+            })
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def metrics(self):
+        """Return the server's metrics dictionary."""
+        return self._request("GET", "/metrics")
+
+    def health(self):
+        """Return the server's health dictionary, also when it reports unhealthy."""
+        return self._request("GET", "/health", error_body=True)
+
+    def _segment(self, job):
+        response = self._request("POST", "/segment", job)
+        return [np.array(c, dtype=np.int32).reshape(-1, 1, 2) for c in response["contours"]]
+
+    def _request(self, method, path, payload=None, error_body=False):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                body = json.loads(e.read())
+            except ValueError:
+                body = {}
+            if error_body and body:
+                return body
+            message = body.get("error", e.reason)
+            raise RuntimeError(f"Segmentation request failed: {message}") from None
+
+
+def main():
+    """
+    Run the segmentation server until interrupted.
+    """
+    parser = argparse.ArgumentParser(description="Local stone segmentation service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--batch-window-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    service = SegmentationService(workers=args.workers, batch_size=args.batch_size,
+                                  batch_window=args.batch_window_ms / 1000)
+    service.start()
+    server = SegmentationServer(service, args.host, args.port)
+    print(f"Segmentation service listening on http://{args.host}:{server.server_port} "
+          f"with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,11 @@ import numpy as np
 from PIL import Image, ImageTk
 import json
 import os
-from tkinter import messagebox
+import threading
+from tkinter import messagebox, filedialog
+from segmentation import segment_stone, odd_kernel, MIN_CONTOUR_AREA
+from measurement import measure_contours, save_measurements
+from auto_tune import auto_tune
 
 
 class SegmentationWindow(ctk.CTkToplevel):
@@ -32,6 +36,7 @@ class SegmentationWindow(ctk.CTkToplevel):
         self.original_image = None
         self.processed_image = None
         self.mask = None
+        self.measurements = None
 
         # --- Contour selection variables ---
         self.all_contours = []
@@ -42,6 +47,11 @@ class SegmentationWindow(ctk.CTkToplevel):
 
         self.show_mask_var = ctk.BooleanVar(value=False)
 
+        # --- Auto tuning variables ---
+        self.auto_tune_budget = 10.0  # seconds
+        self.auto_tune_result = None
+        self.suspend_updates = False  # Set while several sliders change at once
+
         # Default parameters for segmentation
         self.default_params_file = "segmentation_defaults.json"
         self.load_default_parameters()
@@ -155,6 +165,12 @@ class SegmentationWindow(ctk.CTkToplevel):
         default_btn = ctk.CTkButton(controls_frame, text="Set as Default", command=self.save_default_parameters)
         default_btn.pack(pady=20, side="bottom")
 
+        self.auto_score_label = ctk.CTkLabel(controls_frame, text="")
+        self.auto_score_label.pack(side="bottom")
+
+        self.auto_btn = ctk.CTkButton(controls_frame, text="Auto", command=self.start_auto_tune)
+        self.auto_btn.pack(pady=(20, 0), side="bottom")
+
     def create_parameter_sliders(self, parent):
         """Create a set of sliders for adjusting segmentation parameters."""
         self.blur_var = ctk.DoubleVar(value=self.params["blur_kernel"])
@@ -192,6 +208,56 @@ class SegmentationWindow(ctk.CTkToplevel):
             self.update_segmentation()
         variable.trace_add("write", lambda *args: on_slider_change(variable.get()))
 
+    def start_auto_tune(self):
+        """Search for the best parameters in a background thread."""
+        if self.original_image is None: return
+        self.auto_btn.configure(state="disabled", text="Tuning...")
+        self.auto_score_label.configure(text="")
+        self.auto_tune_result = None
+        initial_params = {
+            "blur_kernel": self.blur_var.get(),
+            "threshold_value": self.threshold_var.get(),
+            "erosion_iterations": self.erosion_var.get(),
+            "dilation_iterations": self.dilation_var.get(),
+        }
+
+        def run():
+            try:
+                self.auto_tune_result = auto_tune(self.original_image, self.auto_tune_budget, initial_params)
+            except Exception as e:
+                self.auto_tune_result = e
+
+        threading.Thread(target=run, daemon=True).start()
+        self.after(200, self.finish_auto_tune)
+
+    def finish_auto_tune(self):
+        """Poll for the auto tuning result and apply it to the sliders."""
+        if not self.winfo_exists(): return
+        if self.auto_tune_result is None:
+            self.after(200, self.finish_auto_tune)
+            return
+        result, self.auto_tune_result = self.auto_tune_result, None
+        self.auto_btn.configure(state="normal", text="Auto")
+
+        if isinstance(result, Exception):
+            messagebox.showerror("Error", f"Auto tuning failed: {result}")
+            return
+        params, score = result
+        if params is None:
+            messagebox.showwarning("Auto", "No parameters could be evaluated within the time budget.")
+            return
+        # Apply all four values, then segment once instead of once per slider
+        self.suspend_updates = True
+        try:
+            self.blur_var.set(params["blur_kernel"])
+            self.threshold_var.set(params["threshold_value"])
+            self.erosion_var.set(params["erosion_iterations"])
+            self.dilation_var.set(params["dilation_iterations"])
+        finally:
+            self.suspend_updates = False
+        self.update_segmentation()
+        self.auto_score_label.configure(text=f"Auto score: {score:.2f} (1.00 is best)")
+
     def create_bottom_buttons(self, parent):
         """Create the 'Delete Image' and 'Start' buttons at the bottom."""
         button_frame = ctk.CTkFrame(parent, fg_color="transparent")
@@ -203,11 +269,10 @@ class SegmentationWindow(ctk.CTkToplevel):
 
     def update_segmentation(self):
         """Run segmentation, reset active contours, and update the display."""
-        if self.original_image is None: return
+        if self.original_image is None or self.suspend_updates: return
         try:
-            blur_kernel = int(self.blur_var.get())
-            if blur_kernel % 2 == 0: blur_kernel += 1
-            
+            blur_kernel = odd_kernel(self.blur_var.get())
+
             # Get parameter values from the UI
             params = {
                 "image": self.original_image,
@@ -215,7 +280,7 @@ class SegmentationWindow(ctk.CTkToplevel):
                 "threshold_val": int(self.threshold_var.get()),
                 "erosion_iter": int(self.erosion_var.get()),
                 "dilation_iter": int(self.dilation_var.get()),
-                "min_area": 50000  # <-- Hardcoded value as requested
+                "min_area": MIN_CONTOUR_AREA
             }
 
             self.all_contours = self.segment_stone(**params)
@@ -229,16 +294,7 @@ class SegmentationWindow(ctk.CTkToplevel):
         """
         Perform segmentation using area, returning filtered contours.
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (blur_kernel, blur_kernel), 0)
-        _, thresh = cv2.threshold(blurred, threshold_val, 255, cv2.THRESH_BINARY)
-        kernel = np.ones((3, 3), np.uint8)
-        if erosion_iter > 0: thresh = cv2.erode(thresh, kernel, iterations=erosion_iter)
-        if dilation_iter > 0: thresh = cv2.dilate(thresh, kernel, iterations=dilation_iter)
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        # Filter contours by the fixed minimum area
-        return [c for c in contours if cv2.contourArea(c) > min_area]
+        return segment_stone(image, blur_kernel, threshold_val, erosion_iter, dilation_iter, min_area)
 
     def generate_processed_images(self):
         """Generate the mask and result image based on the currently active contours."""
@@ -298,7 +354,30 @@ class SegmentationWindow(ctk.CTkToplevel):
         self.destroy()
 
     def start_next_step(self):
-        messagebox.showinfo("Next Step", "Next step functionality will be implemented later.")
+        """Measure the selected contours and offer to export the results."""
+        if not self.active_contour_indices:
+            messagebox.showwarning("No Stones", "No contours are selected to measure.")
+            return
+        try:
+            indices = sorted(self.active_contour_indices)
+            contours = [self.all_contours[i] for i in indices]
+            self.measurements = measure_contours(self.original_image, contours, indices)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to measure stones: {e}")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            parent=self,
+            title=f"Save measurements for {len(indices)} stone(s)",
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("NumPy archive", "*.npz")]
+        )
+        if file_path:
+            try:
+                save_measurements(self.measurements, file_path)
+                messagebox.showinfo("Success", f"Measurements saved to {file_path}")
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to save measurements: {e}")
 
     def on_close(self):
         self.destroy()
\ No newline at end of file
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from auto_tune import PARAMETER_RANGES, auto_tune, score_parameters
+from segmentation import segment_stone, MIN_CONTOUR_AREA
+
+
+POLYGON = np.array([[300, 300], [900, 250], [1000, 800], [400, 900]], np.int32)
+
+
+def make_stone_image(noise=30, seed=0):
+    """Two identical bright polygons on a darker, noisy background."""
+    rng = np.random.default_rng(seed)
+    image = np.full((1500, 2000, 3), 70, np.uint8)
+    cv2.fillPoly(image, [POLYGON, POLYGON + [900, 400]], (200, 190, 180))
+    return cv2.add(image, rng.integers(0, noise + 1, image.shape, dtype=np.uint8))
+
+
+def segmented_areas(image, params):
+    contours = segment_stone(image, params["blur_kernel"], params["threshold_value"],
+                             params["erosion_iterations"], params["dilation_iterations"], MIN_CONTOUR_AREA)
+    return [cv2.contourArea(c) for c in contours]
+
+
+def test_dilating_past_the_edge_lowers_the_score():
+    image = make_stone_image()
+    params = {"blur_kernel": 3, "threshold_value": 135, "erosion_iterations": 0, "dilation_iterations": 0}
+    exact = score_parameters(image, params, MIN_CONTOUR_AREA)
+    dilated = score_parameters(image, dict(params, dilation_iterations=6), MIN_CONTOUR_AREA)
+    assert dilated < exact
+
+
+@pytest.mark.parametrize("noise", [0, 30])
+def test_tuned_area_matches_true_area(noise):
+    image = make_stone_image(noise)
+    params, score = auto_tune(image, time_budget=5, workers=1)
+
+    areas = segmented_areas(image, params)
+    assert len(areas) == 2
+    for area in areas:
+        assert area == pytest.approx(cv2.contourArea(POLYGON), rel=0.05)
+    assert 0 < score <= 1
+
+
+def test_result_within_slider_ranges_and_time_budget():
+    image = make_stone_image()
+    start = time.perf_counter()
+    params, _ = auto_tune(image, time_budget=0.5, workers=1, coarse_samples=500)
+    elapsed = time.perf_counter() - start
+
+    # A single candidate may finish after the deadline, but not many.
+    assert elapsed < 1.5
+    assert set(params) == set(PARAMETER_RANGES)
+    for name, (low, high, _) in PARAMETER_RANGES.items():
+        assert low <= params[name] <= high
+    assert params["blur_kernel"] % 2 == 1
+
+
+def test_parallel_search():
+    params, score = auto_tune(make_stone_image(), time_budget=3, workers=2)
+    assert params is not None
+    assert 0 < score <= 1
@@ -0,0 +1,95 @@
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from measurement import MEASUREMENT_COLUMNS, measure_contours, save_measurements
+
+
+@pytest.fixture
+def stones():
+    """An image of random colored shapes and their external contours."""
+    rng = np.random.default_rng(0)
+    image = np.zeros((600, 800, 3), np.uint8)
+    for _ in range(60):
+        x, y = (int(v) for v in rng.integers(30, [770, 570]))
+        color = tuple(int(v) for v in rng.integers(60, 255, 3))
+        if rng.random() < 0.5:
+            cv2.circle(image, (x, y), int(rng.integers(5, 25)), color, -1)
+        else:
+            points = (rng.integers(-25, 25, (6, 2)) + [x, y]).astype(np.int32)
+            cv2.fillPoly(image, [cv2.convexHull(points)], color)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    contours, _ = cv2.findContours((gray > 0).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = [c for c in contours if cv2.contourArea(c) > 0]
+    return image, contours
+
+
+def test_matches_opencv_reference(stones):
+    image, contours = stones
+    table = measure_contours(image, contours)
+
+    assert list(table) == MEASUREMENT_COLUMNS
+    for i, contour in enumerate(contours):
+        moments = cv2.moments(contour)
+        mask = np.zeros(image.shape[:2], np.uint8)
+        cv2.drawContours(mask, [contour], -1, 255, -1)
+
+        assert table["area"][i] == pytest.approx(cv2.contourArea(contour))
+        assert table["perimeter"][i] == pytest.approx(cv2.arcLength(contour, True))
+        bbox = (table["bbox_x"][i], table["bbox_y"][i], table["bbox_w"][i], table["bbox_h"][i])
+        assert bbox == cv2.boundingRect(contour)
+        assert table["centroid_x"][i] == pytest.approx(moments["m10"] / moments["m00"])
+        assert table["centroid_y"][i] == pytest.approx(moments["m01"] / moments["m00"])
+        hu = [table[f"hu_{k}"][i] for k in range(1, 8)]
+        assert hu == pytest.approx(cv2.HuMoments(moments).ravel(), rel=1e-4, abs=1e-12)
+        assert table["hull_area"][i] == pytest.approx(cv2.contourArea(cv2.convexHull(contour)))
+        assert table["pixel_area"][i] == np.count_nonzero(mask)
+        mean_b, mean_g, mean_r, _ = cv2.mean(image, mask=mask)
+        assert (table["mean_b"][i], table["mean_g"][i], table["mean_r"][i]) == pytest.approx((mean_b, mean_g, mean_r))
+
+
+def test_indices_are_recorded(stones):
+    image, contours = stones
+    table = measure_contours(image, contours[:3], indices=[7, 2, 9])
+    assert table["contour_index"].tolist() == [7, 2, 9]
+
+
+def test_empty_contours_give_empty_table():
+    table = measure_contours(np.zeros((10, 10, 3), np.uint8), [])
+    assert list(table) == MEASUREMENT_COLUMNS
+    assert all(len(column) == 0 for column in table.values())
+
+
+def test_degenerate_contour():
+    image = np.full((20, 20, 3), 50, np.uint8)
+    table = measure_contours(image, [np.array([[[5, 7]]], np.int32)])
+    assert table["area"][0] == 0
+    assert (table["centroid_x"][0], table["centroid_y"][0]) == (5, 7)
+    assert np.isnan(table["solidity"][0])
+    assert np.isnan(table["convexity"][0])
+    assert np.isnan(table["hu_1"][0])
+
+
+@pytest.mark.parametrize("extension", [".csv", ".npz"])
+def test_save_round_trip(stones, tmp_path, extension):
+    image, contours = stones
+    table = measure_contours(image, contours)
+    path = tmp_path / f"stones{extension}"
+    save_measurements(table, str(path))
+
+    if extension == ".npz":
+        loaded = np.load(path)
+        assert list(loaded.files) == MEASUREMENT_COLUMNS
+        columns = {name: loaded[name] for name in loaded.files}
+    else:
+        data = np.genfromtxt(path, delimiter=",", names=True)
+        assert list(data.dtype.names) == MEASUREMENT_COLUMNS
+        columns = {name: data[name] for name in data.dtype.names}
+    for name in MEASUREMENT_COLUMNS:
+        np.testing.assert_allclose(columns[name], table[name])
+
+
+def test_save_rejects_unknown_extension(tmp_path):
+    with pytest.raises(ValueError):
+        save_measurements({"area": np.zeros(1)}, str(tmp_path / "stones.txt"))
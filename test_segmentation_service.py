@@ -0,0 +1,99 @@
+import os
+import signal
+import threading
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from segmentation_service import SegmentationClient, SegmentationServer, SegmentationService
+
+
+PARAMS = {
+    "blur_kernel": 5,
+    "threshold_value": 127,
+    "erosion_iterations": 0,
+    "dilation_iterations": 0,
+    "min_area": 1000,
+}
+
+
+def make_stone_image():
+    """Create a dark image with one bright circular 'stone'."""
+    image = np.zeros((200, 300, 3), np.uint8)
+    cv2.circle(image, (150, 100), 60, (230, 230, 230), -1)
+    return image
+
+
+@pytest.fixture
+def service():
+    return SegmentationService(workers=2)
+
+
+@pytest.fixture
+def client(service):
+    service.start()
+    server = SegmentationServer(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield SegmentationClient(port=server.server_port)
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop()
+
+
+def assert_single_stone(contours):
+    assert len(contours) == 1
+    assert contours[0].shape[1:] == (1, 2)
+    assert cv2.contourArea(contours[0]) == pytest.approx(np.pi * 60 ** 2, rel=0.05)
+
+
+def test_segment_path_shm_and_metrics(client, tmp_path):
+    image = make_stone_image()
+    path = tmp_path / "stone.png"
+    cv2.imwrite(str(path), image)
+
+    assert_single_stone(client.segment_path(str(path), PARAMS))
+    assert_single_stone(client.segment_array(image, PARAMS))
+
+    metrics = client.metrics()
+    assert metrics["requests_total"] == 2
+    assert metrics["errors_total"] == 0
+    assert metrics["queue_depth"] == 0
+    assert metrics["running"] == 0
+    assert metrics["latency_ms"]["p50"] is not None
+
+
+def test_missing_path_reports_error(client, tmp_path):
+    with pytest.raises(RuntimeError, match="Could not load image"):
+        client.segment_path(str(tmp_path / "missing.png"), PARAMS)
+    assert client.metrics()["errors_total"] == 1
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_killed_worker_fails_batch_and_pool_recovers(service, client, tmp_path):
+    path = tmp_path / "stone.png"
+    cv2.imwrite(str(path), make_stone_image())
+
+    for pid in list(service._pool._processes):
+        os.kill(pid, signal.SIGKILL)
+
+    # Requests already heading to the dead pool may fail, but they must be
+    # answered and the pool must be replaced instead of stalling the service.
+    results = []
+    for _ in range(3):
+        try:
+            results.append(client.segment_path(str(path), PARAMS))
+        except RuntimeError:
+            results.append(None)
+    assert results[-1] is not None
+    assert_single_stone(results[-1])
+
+    health = client.health()
+    assert health["status"] == "ok"
+    assert health["dispatcher_alive"]
+    assert health["pool_restarts"] >= 1
+    assert client.metrics()["running"] == 0